@@ -1,6 +1,12 @@
 import json
 from datetime import datetime
 from pathlib import Path
+from typing import Dict, List
+
+try:
+    import orjson
+except ImportError:  # optional speedup, stdlib json is used without it
+    orjson = None
 
 from server import (
     MAX_HISTORY,
@@ -22,12 +28,37 @@ def load_json(path: Path, default):
     if not path.exists():
         return default
     try:
+        if orjson is not None:
+            return orjson.loads(path.read_bytes())
         with path.open("r", encoding="utf-8") as handle:
             return json.load(handle)
     except (OSError, json.JSONDecodeError):
         return default
 
 
+def history_rows_from_json(
+    history: List[object], band_employees, finished_at: datetime
+) -> List[Dict[str, object]]:
+    """All rows of one import share finished_at; their id keeps the original order."""
+    rows = []
+    for entry in history[:MAX_HISTORY]:
+        if not isinstance(entry, dict):
+            continue
+        name = str(entry.get("name", entry.get("vehicle_name", "")))
+        if not name:
+            continue
+        rows.append(
+            {
+                "vehicle_name": name,
+                "hours": float(entry.get("hours", 0) or 0),
+                "employees": int(entry.get("employees", DEFAULT_EMPLOYEES) or DEFAULT_EMPLOYEES),
+                "band_employees": band_employees,
+                "finished_at": finished_at,
+            }
+        )
+    return rows
+
+
 def migrate():
     init_db()
     cfg = load_json(CONFIG_JSON, {})
@@ -39,28 +70,19 @@ def migrate():
     while len(band_payload) < 10:
         band_payload.append({"vehicle": None})
 
-    with SessionLocal() as session:
+    history_rows = history_rows_from_json(
+        history if isinstance(history, list) else [],
+        cfg.get("employees", DEFAULT_EMPLOYEES),
+        datetime.utcnow(),
+    )
+
+    with SessionLocal() as session, session.begin():
         update_config_from_payload(session, cfg if isinstance(cfg, dict) else {})
         set_band_and_queue(session, band_payload, queue if isinstance(queue, list) else [])
 
         session.query(HistoryEntry).delete()
-        if isinstance(history, list):
-            for entry in history[:MAX_HISTORY]:
-                name = str(entry.get("name", entry.get("vehicle_name", "")))
-                if not name:
-                    continue
-                hours = float(entry.get("hours", 0) or 0)
-                employees = int(entry.get("employees", DEFAULT_EMPLOYEES) or DEFAULT_EMPLOYEES)
-                session.add(
-                    HistoryEntry(
-                        vehicle_name=name,
-                        hours=hours,
-                        employees=employees,
-                        band_employees=cfg.get("employees", DEFAULT_EMPLOYEES),
-                        finished_at=datetime.utcnow(),
-                    )
-                )
-        session.commit()
+        if history_rows:
+            session.bulk_insert_mappings(HistoryEntry, history_rows)
 
     print("Migration abgeschlossen. Datenbank liegt unter data.db")
 
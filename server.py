@@ -1,11 +1,22 @@
 import argparse
-from datetime import datetime
+import csv
+import io
+import threading
+from datetime import date, datetime
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional
 
 from flask import Flask, Response, jsonify, request, send_from_directory
-from sqlalchemy import Column, Date, DateTime, Float, ForeignKey, Integer, String, UniqueConstraint, create_engine, func
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import Column, Date, DateTime, Float, ForeignKey, Index, Integer, String, UniqueConstraint, create_engine, delete, event, func, insert, inspect, literal, select, text, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import declarative_base, relationship, scoped_session, selectinload, sessionmaker
+from sqlalchemy.pool import QueuePool
+
+try:
+    import orjson
+except ImportError:  # optional speedup, stdlib json is used without it
+    orjson = None
 
 BASE_DIR = Path(__file__).parent
 DATABASE_PATH = BASE_DIR / "data.db"
@@ -19,9 +30,38 @@ DEFAULT_BREAKS = [
 ]
 DEFAULT_EMPLOYEES = 1
 MAX_HISTORY = 1000
+CSV_BATCH_ROWS = 256
+HISTORY_CSV_HEADER = ("finished_at", "vehicle_name", "hours", "employees", "band_employees", "station")
+PLAN_CSV_HEADER = ("type", "station", "position", "vehicle_name", "hours", "employees")
+
+engine = create_engine(
+    DATABASE_URL,
+    future=True,
+    connect_args={"check_same_thread": False},
+    poolclass=QueuePool,
+    # deliberate batch size for multi-VALUES INSERTs: at most 100 rows per statement
+    insertmanyvalues_page_size=100,
+)
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, _connection_record):
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-20000")
+    cursor.close()
+
 
-engine = create_engine(DATABASE_URL, future=True)
 SessionLocal = sessionmaker(bind=engine, expire_on_commit=False, future=True)
+# one session per request thread, released in the teardown_request handler
+Session = scoped_session(SessionLocal)
+# SQLite has a single writer. Write routes take this lock so bursts of clicks
+# queue up in-process instead of failing with "database is locked" or
+# advancing the band from the same stale snapshot.
+write_lock = threading.Lock()
+_db_state = {"initialized": False}
 Base = declarative_base()
 
 
@@ -33,6 +73,7 @@ class Setting(Base):
     window_start = Column(String(8), default=DEFAULT_WINDOW["start"])
     window_end = Column(String(8), default=DEFAULT_WINDOW["end"])
     work_days = Column(String(20), default=",".join(str(d) for d in DEFAULT_WINDOW["days"]))
+    config_version = Column(Integer, nullable=False, default=0, server_default="0")
 
 
 class BreakPeriod(Base):
@@ -87,43 +128,117 @@ class HistoryEntry(Base):
     vehicle_name = Column(String(200), nullable=False)
     hours = Column(Float, default=0.0)
     employees = Column(Integer, default=DEFAULT_EMPLOYEES)
-    finished_at = Column(DateTime, default=datetime.utcnow, index=True)
+    finished_at = Column(DateTime, default=datetime.utcnow)
     station = Column(Integer, default=10)
     band_employees = Column(Integer, default=DEFAULT_EMPLOYEES)
+    __table_args__ = (Index("ix_history_finished_at_desc", finished_at.desc(), id.desc()),)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, keeps the default sorted-key layout."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        option = orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+        if kwargs.get("indent"):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
 
 
 app = Flask(__name__, static_folder=str(BASE_DIR / "static"))
+if orjson is not None:
+    app.json = OrjsonProvider(app)
+
+
+@app.teardown_request
+def remove_session(_exc):
+    Session.remove()
 
 
 # Helpers
 
 def require_admin() -> Optional[Response]:
-    pin = request.headers.get("X-Admin-Pin") or request.json and request.json.get("adminPin")
-    if pin and str(pin) == ADMIN_PIN:
+    if request.method == "GET":
         return None
-    if request.method.lower() == "get":
+    pin = request.headers.get("X-Admin-Pin")
+    if pin is None and request.is_json:
+        # get_json caches its result, so the route's own get_json call does not parse again
+        body = request.get_json(silent=True)
+        if isinstance(body, dict):
+            pin = body.get("adminPin")
+    if pin and str(pin) == ADMIN_PIN:
         return None
     response = jsonify({"error": "Invalid admin PIN"})
     response.status_code = 403
     return response
 
 
+def iter_csv(header: Iterable[object], rows: Iterable[Iterable[object]]) -> Iterator[str]:
+    """Yield CSV text: the header on its own, then rows in chunks of CSV_BATCH_ROWS."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+
+    def drain() -> str:
+        chunk = buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+        return chunk
+
+    writer.writerow(header)
+    yield drain()
+    for index, row in enumerate(rows, start=1):
+        writer.writerow(row)
+        if index % CSV_BATCH_ROWS == 0:
+            yield drain()
+    if buffer.tell():
+        yield drain()
+
+
 def init_db(with_defaults: bool = True):
     Base.metadata.create_all(engine)
+    # create_all skips existing tables: swap the old ascending finished_at index
+    # for the (finished_at DESC, id DESC) one on databases created before it
+    with engine.begin() as connection:
+        connection.execute(text("DROP INDEX IF EXISTS ix_history_entries_finished_at"))
+        for index in HistoryEntry.__table__.indexes:
+            index.create(connection, checkfirst=True)
+        setting_columns = {column["name"] for column in inspect(connection).get_columns("settings")}
+        if "config_version" not in setting_columns:
+            connection.execute(
+                text("ALTER TABLE settings ADD COLUMN config_version INTEGER NOT NULL DEFAULT 0")
+            )
     if not with_defaults:
         return
-    with SessionLocal() as session:
-        if session.query(Setting).count() == 0:
-            session.add(Setting())
-        existing_breaks = session.query(BreakPeriod).count()
-        if existing_breaks == 0:
-            for entry in DEFAULT_BREAKS:
-                session.add(BreakPeriod(start_time=entry["start"], end_time=entry["end"]))
-        existing_slots = session.query(BandSlot).count()
-        if existing_slots == 0:
-            for station in range(1, 11):
-                session.add(BandSlot(station=station, vehicle_id=None))
-        session.commit()
+    with SessionLocal() as session, session.begin():
+        # seed a settings row only into an empty table, remaining columns use their defaults
+        session.execute(
+            insert(Setting).from_select(
+                ["employees"],
+                select(literal(DEFAULT_EMPLOYEES)).where(~select(Setting.id).exists()),
+            )
+        )
+        if session.scalar(select(BreakPeriod.id).limit(1)) is None:
+            session.execute(
+                insert(BreakPeriod),
+                [{"start_time": entry["start"], "end_time": entry["end"]} for entry in DEFAULT_BREAKS],
+            )
+        session.execute(
+            sqlite_insert(BandSlot).on_conflict_do_nothing(),
+            [{"station": station, "vehicle_id": None} for station in range(1, 11)],
+        )
+    _db_state["initialized"] = True
+
+
+@app.before_request
+def ensure_db():
+    # WSGI servers never call main(), so set up the database on the first request
+    if _db_state["initialized"]:
+        return
+    with write_lock:
+        if not _db_state["initialized"]:
+            init_db()
 
 
 def serialize_vehicle(vehicle: Optional[Vehicle]) -> Optional[Dict[str, object]]:
@@ -137,27 +252,68 @@ def serialize_vehicle(vehicle: Optional[Vehicle]) -> Optional[Dict[str, object]]
     }
 
 
+# Per-process cache of the config payload, keyed by settings.config_version.
+# Every config update bumps that column, so a one-column SELECT tells each
+# worker whether its cached payload is still current.
+_config_cache: Dict[str, object] = {"version": None, "payload": None}
+_config_cache_lock = threading.Lock()
+
+
 def get_config_payload(session) -> Dict[str, object]:
-    setting = session.query(Setting).first()
+    """Return the config payload, cached until the config changes. Treat it as read-only."""
+    version = session.scalar(select(Setting.config_version).limit(1))
+    with _config_cache_lock:
+        if _config_cache["payload"] is not None and _config_cache["version"] == version:
+            return _config_cache["payload"]
+    # same transaction as the version read, so payload and version belong together
+    payload = build_config_payload(session)
+    with _config_cache_lock:
+        _config_cache["version"] = version
+        _config_cache["payload"] = payload
+    return payload
+
+
+def build_config_payload(session) -> Dict[str, object]:
+    # column rows only, no ORM instances are needed to build the payload
+    setting = session.query(
+        Setting.window_start, Setting.window_end, Setting.work_days, Setting.employees
+    ).first()
     breaks = [
-        {"id": br.id, "start": br.start_time, "end": br.end_time}
-        for br in session.query(BreakPeriod).order_by(BreakPeriod.start_time)
+        {"id": break_id, "start": start, "end": end}
+        for break_id, start, end in session.query(
+            BreakPeriod.id, BreakPeriod.start_time, BreakPeriod.end_time
+        ).order_by(BreakPeriod.start_time)
     ]
-    holidays = [h.date.isoformat() for h in session.query(Holiday).order_by(Holiday.date)]
-    return {
-        "window": {
-            "start": setting.window_start if setting else DEFAULT_WINDOW["start"],
-            "end": setting.window_end if setting else DEFAULT_WINDOW["end"],
-            "days": [int(d) for d in (setting.work_days.split(",") if setting else DEFAULT_WINDOW["days"])],
-        },
-        "breaks": breaks,
-        "freeDays": holidays,
-        "employees": setting.employees if setting else DEFAULT_EMPLOYEES,
-    }
+    holidays = [day.isoformat() for (day,) in session.query(Holiday.date).order_by(Holiday.date)]
+    if setting is None:
+        window = {
+            "start": DEFAULT_WINDOW["start"],
+            "end": DEFAULT_WINDOW["end"],
+            "days": list(DEFAULT_WINDOW["days"]),
+        }
+        employees = DEFAULT_EMPLOYEES
+    else:
+        window = {
+            "start": setting.window_start,
+            "end": setting.window_end,
+            "days": [int(d) for d in setting.work_days.split(",")],
+        }
+        employees = setting.employees
+    return {"window": window, "breaks": breaks, "freeDays": holidays, "employees": employees}
+
+
+def get_employees(session) -> int:
+    employees = session.query(Setting.employees).limit(1).scalar()
+    return employees if employees is not None else DEFAULT_EMPLOYEES
 
 
 def get_band_payload(session) -> List[Dict[str, object]]:
-    slots = session.query(BandSlot).order_by(BandSlot.station).all()
+    slots = (
+        session.query(BandSlot)
+        .options(selectinload(BandSlot.vehicle))
+        .order_by(BandSlot.station)
+        .all()
+    )
     return [
         {
             "station": slot.station,
@@ -168,27 +324,55 @@ def get_band_payload(session) -> List[Dict[str, object]]:
 
 
 def get_queue_payload(session) -> List[Dict[str, object]]:
-    entries = session.query(QueueEntry).order_by(QueueEntry.position).all()
+    entries = (
+        session.query(QueueEntry)
+        .options(selectinload(QueueEntry.vehicle))
+        .order_by(QueueEntry.position)
+        .all()
+    )
     return [serialize_vehicle(entry.vehicle) for entry in entries if entry.vehicle]
 
 
+def vehicle_row_from_payload(payload: Dict[str, object]) -> Dict[str, object]:
+    return {
+        "name": str(payload.get("name", "")).strip(),
+        "hours": float(payload.get("hours", 0) or 0),
+        "employees": int(payload.get("employees", DEFAULT_EMPLOYEES) or DEFAULT_EMPLOYEES),
+    }
+
+
 def create_vehicle_from_payload(session, payload: Dict[str, object]) -> Vehicle:
-    vehicle = Vehicle(
-        name=str(payload.get("name", "")).strip(),
-        hours=float(payload.get("hours", 0) or 0),
-        employees=int(payload.get("employees", DEFAULT_EMPLOYEES) or DEFAULT_EMPLOYEES),
-    )
+    vehicle = Vehicle(**vehicle_row_from_payload(payload))
     session.add(vehicle)
     session.flush()
     return vehicle
 
 
+def append_to_queue(session, vehicle_id: int):
+    # read MAX(position) and insert in one statement, so concurrent adds
+    # cannot pick the same position
+    next_position = select(func.coalesce(func.max(QueueEntry.position), 0) + 1, literal(vehicle_id))
+    session.execute(insert(QueueEntry).from_select(["position", "vehicle_id"], next_position))
+
+
+def parse_free_days(raw_days: List[object]) -> List[date]:
+    # set drops duplicates that would violate the unique holidays.date column
+    parsed = set()
+    for raw in raw_days:
+        try:
+            parsed.add(datetime.strptime(str(raw), "%Y-%m-%d").date())
+        except ValueError:
+            continue
+    return sorted(parsed)
+
+
 def update_config_from_payload(session, payload: Dict[str, object]):
     config_data = payload.get("config", payload)
     setting = session.query(Setting).first()
     if not setting:
         setting = Setting()
         session.add(setting)
+    setting.config_version = (setting.config_version or 0) + 1
     window = config_data.get("window", {})
     days = window.get("days", DEFAULT_WINDOW["days"])
     setting.window_start = str(window.get("start", setting.window_start or DEFAULT_WINDOW["start"]))
@@ -204,47 +388,74 @@ def update_config_from_payload(session, payload: Dict[str, object]):
     breaks = config_data.get("breaks")
     if isinstance(breaks, list):
         session.query(BreakPeriod).delete()
-        for entry in breaks:
-            start, end = entry.get("start"), entry.get("end")
-            if start and end:
-                session.add(BreakPeriod(start_time=str(start), end_time=str(end)))
+        break_rows = [
+            {"start_time": str(entry["start"]), "end_time": str(entry["end"])}
+            for entry in breaks
+            if isinstance(entry, dict) and entry.get("start") and entry.get("end")
+        ]
+        if break_rows:
+            session.execute(insert(BreakPeriod), break_rows)
 
     holidays = config_data.get("freeDays")
     if isinstance(holidays, list):
         session.query(Holiday).delete()
-        for raw in holidays:
-            try:
-                parsed = datetime.strptime(str(raw), "%Y-%m-%d").date()
-                session.add(Holiday(date=parsed))
-            except ValueError:
-                continue
-    session.commit()
+        holiday_rows = [{"date": day} for day in parse_free_days(holidays)]
+        if holiday_rows:
+            session.execute(insert(Holiday), holiday_rows)
+    session.flush()
 
 
 def set_band_and_queue(session, band: List[Dict[str, object]], queue: List[Dict[str, object]]):
-    # Update band
-    session.query(BandSlot).delete()
+    band_vehicles = {}
     for station_idx in range(1, 11):
         vehicle_payload = band[station_idx - 1].get("vehicle") if station_idx - 1 < len(band) else None
-        vehicle = None
         if vehicle_payload and vehicle_payload.get("name"):
-            vehicle = create_vehicle_from_payload(session, vehicle_payload)
-        session.add(BandSlot(station=station_idx, vehicle=vehicle))
+            band_vehicles[station_idx] = vehicle_payload
+    queue_vehicles = [
+        (position, payload)
+        for position, payload in enumerate(queue, start=1)
+        if payload and payload.get("name")
+    ]
+
+    # Create all vehicles in one statement. SQLite cannot batch an ordered
+    # RETURNING, but it hands out ascending rowids in VALUES order, so the
+    # sorted ids line up with the payload order.
+    vehicle_rows = [vehicle_row_from_payload(payload) for payload in band_vehicles.values()]
+    vehicle_rows += [vehicle_row_from_payload(payload) for _, payload in queue_vehicles]
+    vehicle_ids = []
+    if vehicle_rows:
+        vehicle_ids = sorted(session.scalars(insert(Vehicle).returning(Vehicle.id), vehicle_rows))
+    band_ids = dict(zip(band_vehicles, vehicle_ids))
+    queue_ids = vehicle_ids[len(band_vehicles):]
+
+    # Update band
+    session.query(BandSlot).delete()
+    session.execute(
+        insert(BandSlot),
+        [{"station": station_idx, "vehicle_id": band_ids.get(station_idx)} for station_idx in range(1, 11)],
+    )
 
     # Update queue
     session.query(QueueEntry).delete()
-    for position, payload in enumerate(queue, start=1):
-        if payload and payload.get("name"):
-            vehicle = create_vehicle_from_payload(session, payload)
-            session.add(QueueEntry(position=position, vehicle=vehicle))
-    session.commit()
+    if queue_vehicles:
+        session.execute(
+            insert(QueueEntry),
+            [
+                {"position": position, "vehicle_id": vehicle_id}
+                for (position, _), vehicle_id in zip(queue_vehicles, queue_ids)
+            ],
+        )
+    session.flush()
 
 
 def advance_band(session):
-    band = session.query(BandSlot).order_by(BandSlot.station).all()
-    queue_entries = session.query(QueueEntry).order_by(QueueEntry.position).all()
-    setting = session.query(Setting).first()
-    employees_count = setting.employees if setting else DEFAULT_EMPLOYEES
+    band = (
+        session.query(BandSlot)
+        .options(selectinload(BandSlot.vehicle))
+        .order_by(BandSlot.station)
+        .all()
+    )
+    first_entry = session.query(QueueEntry).order_by(QueueEntry.position).first()
 
     finished_vehicle = band[-1].vehicle if band else None
     if finished_vehicle and finished_vehicle.name:
@@ -252,52 +463,48 @@ def advance_band(session):
             vehicle_name=finished_vehicle.name,
             hours=finished_vehicle.hours,
             employees=finished_vehicle.employees,
-            band_employees=employees_count,
+            band_employees=get_employees(session),
             finished_at=datetime.utcnow(),
             station=band[-1].station,
         )
         session.add(history_entry)
+        enforce_history_limit(session)
 
-    shifted = [None] * 10
-    # shift vehicles down the band
-    for i in range(8, -1, -1):
-        shifted[i + 1] = band[i].vehicle if band and band[i] else None
+    # shift vehicles down the band in place
+    for i in range(len(band) - 1, 0, -1):
+        band[i].vehicle_id = band[i - 1].vehicle_id
 
     # new vehicle from queue
-    next_vehicle = None
-    if queue_entries:
-        first_entry = queue_entries.pop(0)
-        next_vehicle = first_entry.vehicle
+    next_vehicle_id = None
+    if first_entry:
+        next_vehicle_id = first_entry.vehicle_id
         session.delete(first_entry)
-        for new_pos, entry in enumerate(queue_entries, start=1):
-            entry.position = new_pos
-    shifted[0] = next_vehicle
-
-    # persist shifted band
-    session.query(BandSlot).delete()
-    for station_idx in range(1, 11):
-        session.add(BandSlot(station=station_idx, vehicle=shifted[station_idx - 1]))
+        session.flush()
+        session.execute(
+            update(QueueEntry)
+            .where(QueueEntry.position > first_entry.position)
+            .values(position=QueueEntry.position - 1)
+        )
+    if band:
+        band[0].vehicle_id = next_vehicle_id
 
     session.commit()
-    enforce_history_limit(session)
+    # vehicle_id was rotated directly, so drop the stale relationship state
+    for slot in band:
+        session.expire(slot, ["vehicle"])
 
 
 def enforce_history_limit(session):
-    count = session.query(HistoryEntry).count()
-    if count > MAX_HISTORY:
-        excess = count - MAX_HISTORY
-        oldest = (
-            session.query(HistoryEntry)
-            .order_by(HistoryEntry.finished_at)
-            .limit(excess)
-            .all()
-        )
-        for entry in oldest:
-            session.delete(entry)
-        session.commit()
-
-
-init_db()
+    # everything past the newest MAX_HISTORY rows, no COUNT needed
+    excess = (
+        select(HistoryEntry.id)
+        .order_by(HistoryEntry.finished_at.desc(), HistoryEntry.id.desc())
+        .offset(MAX_HISTORY)
+    )
+    session.execute(
+        delete(HistoryEntry).where(HistoryEntry.id.in_(excess)),
+        execution_options={"synchronize_session": False},
+    )
 
 
 @app.route("/")
@@ -310,22 +517,22 @@ def config_route():
     admin_error = require_admin()
     if admin_error:
         return admin_error
-    with SessionLocal() as session:
-        if request.method == "GET":
-            return jsonify(get_config_payload(session))
-        payload = request.get_json(force=True, silent=True) or {}
-        update_config_from_payload(session, payload)
+    session = Session()
+    if request.method == "GET":
         return jsonify(get_config_payload(session))
+    payload = request.get_json(force=True, silent=True) or {}
+    with write_lock, session.begin():
+        update_config_from_payload(session, payload)
+    return jsonify(get_config_payload(session))
 
 
 @app.route("/api/plan", methods=["GET", "POST"])
 def plan_route():
     if request.method == "GET":
-        with SessionLocal() as session:
-            config_data = get_config_payload(session)
-            band = get_band_payload(session)
-            queue = get_queue_payload(session)
-            return jsonify({"band": band, "queue": queue, "employees": config_data.get("employees")})
+        session = Session()
+        band = get_band_payload(session)
+        queue = get_queue_payload(session)
+        return jsonify({"band": band, "queue": queue, "employees": get_employees(session)})
 
     admin_error = require_admin()
     if admin_error:
@@ -333,11 +540,12 @@ def plan_route():
     payload = request.get_json(force=True, silent=True) or {}
     band_payload = payload.get("band") or []
     queue_payload = payload.get("queue") or []
-    with SessionLocal() as session:
+    session = Session()
+    with write_lock, session.begin():
         set_band_and_queue(session, band_payload, queue_payload)
         if "employees" in payload:
             update_config_from_payload(session, {"employees": payload.get("employees")})
-        return jsonify({"band": get_band_payload(session), "queue": get_queue_payload(session)})
+    return jsonify({"band": get_band_payload(session), "queue": get_queue_payload(session)})
 
 
 @app.route("/api/band/advance", methods=["POST"])
@@ -345,68 +553,88 @@ def band_advance():
     admin_error = require_admin()
     if admin_error:
         return admin_error
-    with SessionLocal() as session:
+    session = Session()
+    with write_lock:
         advance_band(session)
-        return jsonify({"band": get_band_payload(session), "queue": get_queue_payload(session)})
+    return jsonify({"band": get_band_payload(session), "queue": get_queue_payload(session)})
 
 
 @app.route("/api/history", methods=["GET"])
 def history_route():
     limit = min(int(request.args.get("limit", 100)), MAX_HISTORY)
     offset = int(request.args.get("offset", 0))
-    with SessionLocal() as session:
-        entries = (
-            session.query(HistoryEntry)
-            .order_by(HistoryEntry.finished_at.desc())
-            .offset(offset)
-            .limit(limit)
-            .all()
-        )
-        return jsonify(
-            [
-                {
-                    "id": entry.id,
-                    "vehicle_name": entry.vehicle_name,
-                    "hours": entry.hours,
-                    "employees": entry.employees,
-                    "band_employees": entry.band_employees,
-                    "finished_at": entry.finished_at.isoformat(),
-                    "station": entry.station,
-                }
-                for entry in entries
-            ]
-        )
+    session = Session()
+    entries = (
+        session.query(HistoryEntry)
+        .order_by(HistoryEntry.finished_at.desc(), HistoryEntry.id.desc())
+        .offset(offset)
+        .limit(limit)
+        .all()
+    )
+    return jsonify(
+        [
+            {
+                "id": entry.id,
+                "vehicle_name": entry.vehicle_name,
+                "hours": entry.hours,
+                "employees": entry.employees,
+                "band_employees": entry.band_employees,
+                "finished_at": entry.finished_at.isoformat(),
+                "station": entry.station,
+            }
+            for entry in entries
+        ]
+    )
 
 
 @app.route("/export/history.csv", methods=["GET"])
 def export_history():
     def generate():
-        yield "finished_at,vehicle_name,hours,employees,band_employees,station\n"
-        with SessionLocal() as session:
-            entries = session.query(HistoryEntry).order_by(HistoryEntry.finished_at.desc()).all()
-            for entry in entries:
-                yield f"{entry.finished_at.isoformat()},{entry.vehicle_name},{entry.hours},{entry.employees},{entry.band_employees},{entry.station}\n"
+        session = SessionLocal()
+        try:
+            entries = session.scalars(
+                select(HistoryEntry)
+                .order_by(HistoryEntry.finished_at.desc(), HistoryEntry.id.desc())
+                .execution_options(yield_per=500)
+            )
+            rows = (
+                (
+                    entry.finished_at.isoformat(),
+                    entry.vehicle_name,
+                    entry.hours,
+                    entry.employees,
+                    entry.band_employees,
+                    entry.station,
+                )
+                for entry in entries
+            )
+            yield from iter_csv(HISTORY_CSV_HEADER, rows)
+        finally:
+            session.close()
 
     return Response(generate(), mimetype="text/csv")
 
 
 @app.route("/export/plan.csv", methods=["GET"])
 def export_plan():
+    def plan_rows(session):
+        for slot in session.query(BandSlot).options(selectinload(BandSlot.vehicle)).order_by(BandSlot.station):
+            vehicle = serialize_vehicle(slot.vehicle)
+            if vehicle:
+                yield ("band", slot.station, "", vehicle["name"], vehicle["hours"], vehicle["employees"])
+            else:
+                yield ("band", slot.station, "", "", "", "")
+        for entry in session.query(QueueEntry).options(selectinload(QueueEntry.vehicle)).order_by(QueueEntry.position):
+            vehicle = serialize_vehicle(entry.vehicle)
+            yield ("queue", "", entry.position, vehicle["name"], vehicle["hours"], vehicle["employees"])
+
     def generate():
-        yield "type,station,position,vehicle_name,hours,employees\n"
         with SessionLocal() as session:
-            for slot in session.query(BandSlot).order_by(BandSlot.station):
-                vehicle = serialize_vehicle(slot.vehicle)
-                if vehicle:
-                    yield f"band,{slot.station},,{vehicle['name']},{vehicle['hours']},{vehicle['employees']}\n"
-                else:
-                    yield f"band,{slot.station},,,,,\n"
-            for entry in session.query(QueueEntry).order_by(QueueEntry.position):
-                vehicle = serialize_vehicle(entry.vehicle)
-                yield f"queue,,{entry.position},{vehicle['name']},{vehicle['hours']},{vehicle['employees']}\n"
+            yield from iter_csv(PLAN_CSV_HEADER, plan_rows(session))
 
     return Response(generate(), mimetype="text/csv")
 
+
 @app.route("/api/queue", methods=["POST"])
 def queue_add():
     admin_error = require_admin()
@@ -414,12 +642,12 @@ def queue_add():
         return admin_error
     payload = request.get_json(force=True, silent=True) or {}
     vehicle_data = payload.get("vehicle") or payload
-    with SessionLocal() as session:
+    session = Session()
+    with write_lock:
         vehicle = create_vehicle_from_payload(session, vehicle_data)
-        max_position = session.query(func.max(QueueEntry.position)).scalar() or 0
-        session.add(QueueEntry(position=max_position + 1, vehicle=vehicle))
+        append_to_queue(session, vehicle.id)
         session.commit()
-        return jsonify({"queue": get_queue_payload(session)})
+    return jsonify({"queue": get_queue_payload(session)})
 
 
 @app.route("/health", methods=["GET"])